@@ -1,62 +1,82 @@
 """
 Django command to create fake posts and populate the database with them.
 """
-import random
 import requests
 
-from io import BytesIO
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
 from faker import Faker
+from celery import group
 
-from django.core.files.uploadedfile import SimpleUploadedFile
-from django.utils.text import slugify
 from django.contrib.auth import get_user_model
 from django.core.management import BaseCommand
 
 from core.models import Post, Tag
+from core.populate import (
+    build_fake_post,
+    download_image,
+    random_tag_ids,
+    save_cover_image,
+)
+from core.tasks import create_fake_post
+
+NUMBER_OF_POSTS = 30
+DOWNLOAD_WORKERS = 10
 
 
 class Command(BaseCommand):
     """Django command to populate the database with posts."""
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--celery',
+            action='store_true',
+            help='Create the posts in Celery workers instead of in this process.'
+        )
+
     def handle(self, *args, **options):
         email = 'admin1@example.com'
-        author = get_user_model().objects.filter(email=email).first()
+        # Only the ID is needed to assign the author to posts
+        author = get_user_model().objects.filter(email=email).only('id').first()
         if not author:
             author = get_user_model().objects.create_superuser(
                 email=email,
                 password='admin123',
                 username='admin1'
             )
-        for _ in range(30):
-            fake = Faker()
-            title = fake.sentence(nb_words=6, variable_nb_words=True, ext_word_list=None)
-            slug = slugify(title)
-            description = fake.text(max_nb_chars=200)
-            body = fake.text(max_nb_chars=1000)
-
-            # Get an image
-            img_url = fake.image_url()
-            response = requests.get(img_url)
-            img = Image.open(BytesIO(response.content))
-
-            # Convert the image to JPEG format
-            img_io = BytesIO()
-            img.save(img_io, format='JPEG')
-            cover_image = SimpleUploadedFile(
-                name='image.jpg',
-                content=img_io.getvalue(),
-                content_type='image/jpeg'
-            )
 
-            tags = Tag.objects.all().order_by('?')[:random.randint(1, 5)]
-            post = Post.objects.create(
-                title=title,
-                slug=slug,
-                author=author,
-                description=description,
-                body=body,
-                cover_image=cover_image,
-            )
-            post.tags.set(tags)
-            post.save()
+        if options['celery']:
+            group(
+                create_fake_post.s(author.id) for _ in range(NUMBER_OF_POSTS)
+            ).apply_async()
+            return
+
+        # Tags do not change while populating, so fetch their IDs once
+        # and draw random samples in Python instead of ORDER BY RANDOM()
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        fake = Faker()
+
+        # Download all the images concurrently, reusing connections
+        img_urls = [fake.image_url() for _ in range(NUMBER_OF_POSTS)]
+        with requests.Session() as session, \
+                ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+            images = list(executor.map(
+                lambda url: download_image(session, url),
+                img_urls
+            ))
+
+        posts = [build_fake_post(fake, author, image) for image in images]
+        post_tags = [random_tag_ids(tag_ids) for _ in posts]
+
+        # Write the cover images concurrently instead of
+        # one after another while the posts are inserted
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+            list(executor.map(save_cover_image, posts))
+
+        # Insert all posts and their tags at once,
+        # instead of a few queries per post
+        Post.objects.bulk_create(posts)
+        Post.tags.through.objects.bulk_create([
+            Post.tags.through(post_id=post.id, tag_id=tag_id)
+            for post, chosen_ids in zip(posts, post_tags)
+            for tag_id in chosen_ids
+        ])
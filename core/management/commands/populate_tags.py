@@ -12,8 +12,5 @@ class Command(BaseCommand):
     """Django command to populate the database with tags."""
 
     def handle(self, *args, **options):
-        for _ in range(30):
-            fake = Faker()
-            name = fake.word()
-            tag = Tag.objects.create(name=name)
-            tag.save()
\ No newline at end of file
+        fake = Faker()
+        Tag.objects.bulk_create([Tag(name=fake.word()) for _ in range(30)])
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.7 on 2026-10-14 05:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_alter_userprofile_points_vote'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created_at'], name='core_commen_post_id_0d7c44_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at', '-updated_at'], name='core_post_created_44ef40_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['comment', 'vote_type'], name='core_vote_comment_e4c6a3_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.7 on 2026-10-14 05:33
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def delete_duplicate_votes(apps, schema_editor):
+    """Keep only the newest vote of every user for every comment,
+       older duplicates would violate the new constraint."""
+    Vote = apps.get_model('core', 'Vote')
+    newest_votes = Vote.objects.order_by().values(
+        'user', 'comment'
+    ).annotate(newest_id=Max('id')).values('newest_id')
+    Vote.objects.exclude(id__in=newest_votes).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_add_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('user', 'comment'), name='unique_user_comment_vote'),
+        ),
+    ]
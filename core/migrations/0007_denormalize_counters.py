@@ -0,0 +1,55 @@
+# Generated by Django 4.1.7 on 2026-10-14 05:36
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, field, **filters):
+    """Return a subquery counting rows of the model related to the outer row."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}, **filters)
+        .order_by()
+        .values(field)
+        .annotate(count=Count('pk'))
+        .values('count')
+    ), 0)
+
+
+def fill_counters(apps, schema_editor):
+    """Fill the new counters from the existing comments and votes."""
+    Post = apps.get_model('core', 'Post')
+    Comment = apps.get_model('core', 'Comment')
+    Vote = apps.get_model('core', 'Vote')
+
+    Post.objects.update(number_of_comments=count_subquery(Comment, 'post'))
+    Comment.objects.update(
+        number_of_upvotes=count_subquery(Vote, 'comment', vote_type='upvote'),
+        number_of_downvotes=count_subquery(Vote, 'comment', vote_type='downvote'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_vote_unique_user_comment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='number_of_downvotes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='number_of_upvotes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='number_of_comments',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
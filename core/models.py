@@ -4,7 +4,7 @@ Database models.
 import uuid
 import os
 
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.conf import settings
 from django.utils.text import slugify
@@ -17,6 +17,31 @@ def image_file_path(instance, filename):
     return os.path.join('uploads', 'post', filename)
 
 
+def _updates_row(instance, save_kwargs):
+    """Return whether a save of the instance updates its stored row.
+       Instances without a primary key, e.g. copies or deleted ones,
+       are inserted as new rows."""
+    return (
+        instance.pk is not None
+        and not instance._state.adding
+        and not save_kwargs.get('force_insert')
+    )
+
+
+def _fields_to_update(instance, update_fields, excluded):
+    """Return the names of the fields a save of an existing instance
+       writes, that is the given ones or all the loaded ones, without
+       the excluded. Deferred fields are not written, as in a save
+       without update_fields."""
+    if update_fields is None:
+        deferred = instance.get_deferred_fields()
+        update_fields = [
+            field.attname for field in instance._meta.concrete_fields
+            if not field.primary_key and field.attname not in deferred
+        ]
+    return [name for name in update_fields if name not in excluded]
+
+
 class UserManager(BaseUserManager):
     """Manager for users."""
 
@@ -71,6 +96,8 @@ class UserProfile(models.Model):
 
 class Post(models.Model):
     """Post table."""
+    COUNTER_FIELDS = ('number_of_comments',)
+
     title = models.CharField(max_length=240, unique=True)
     slug = models.SlugField(max_length=255, unique=True)
     author = models.ForeignKey(
@@ -81,6 +108,9 @@ class Post(models.Model):
     body = models.TextField()
     cover_image = models.ImageField(upload_to=image_file_path, blank=False, null=False)
     tags = models.ManyToManyField('Tag')
+    # Kept up to date by the comment signals, so that listing
+    # posts does not need to count their comments
+    number_of_comments = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -89,26 +119,33 @@ class Post(models.Model):
 
     class Meta:
         ordering = ['-created_at', '-updated_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-updated_at']),
+        ]
 
     @property
     def comments(self):
-        """Return comments for this post."""
-        return Comment.objects.filter(post=self)
-
-    @property
-    def number_of_comments(self):
-        """Return the number of comments for this post."""
-        return self.comments.count()
+        """Return comments for this post. Uses the reverse relation,
+           so comments prefetched with the post are not queried again."""
+        return self.comment_set.all()
 
     @property
     def images(self):
-        """Return images for this post."""
-        return PostImage.objects.filter(post=self)
+        """Return images for this post. Uses the reverse relation,
+           so images prefetched with the post are not queried again."""
+        return self.postimage_set.all()
 
     def save(self, *args, **kwargs):
-        """Create a slug for this post before saving it."""
+        """Create a slug for this post before saving it.
+           The comment counter is written only by the insert."""
         if not self.slug:
             self.slug = slugify(self.title)
+        if _updates_row(self, kwargs):
+            # The counter is changed only by the signals, the value
+            # loaded with the post may be stale, so it is not written
+            kwargs['update_fields'] = _fields_to_update(
+                self, kwargs.get('update_fields'), self.COUNTER_FIELDS
+            )
         return super().save(*args, **kwargs)
 
 
@@ -124,30 +161,38 @@ class PostImage(models.Model):
 
 class Comment(models.Model):
     """Comment to a post."""
+    COUNTER_FIELDS = ('number_of_upvotes', 'number_of_downvotes')
+
     text = models.TextField(max_length=1000)
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    # Kept up to date by the vote signals
+    number_of_upvotes = models.PositiveIntegerField(default=0, editable=False)
+    number_of_downvotes = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    @property
-    def number_of_upvotes(self):
-        """Returns number of upvotes for this comment."""
-        return Vote.objects.filter(comment=self, vote_type=Vote.UPVOTE).count()
-
-    @property
-    def number_of_downvotes(self):
-        """Returns number of upvotes for this comment."""
-        return Vote.objects.filter(comment=self, vote_type=Vote.DOWNVOTE).count()
-
     def __str__(self):
         return f'{self.author}: {self.text[:20]}'
 
     class Meta:
         ordering = ['-created_at', '-updated_at']
+        indexes = [
+            models.Index(fields=['post', 'created_at']),
+        ]
+
+    def save(self, *args, **kwargs):
+        """Save the comment without overwriting its vote counters."""
+        if _updates_row(self, kwargs):
+            # The counters are changed only by the signals, the values
+            # loaded with the comment may be stale, so they are not written
+            kwargs['update_fields'] = _fields_to_update(
+                self, kwargs.get('update_fields'), self.COUNTER_FIELDS
+            )
+        return super().save(*args, **kwargs)
 
 
 class Vote(models.Model):
@@ -163,6 +208,40 @@ class Vote(models.Model):
     comment = models.ForeignKey(Comment, on_delete=models.CASCADE)
     vote_type = models.CharField(choices=VOTE_CHOICES, max_length=8)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['comment', 'vote_type']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'comment'],
+                name='unique_user_comment_vote'
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        """Save the vote. The signals update the counters and points
+           when a vote is created or deleted, or when vote_type is in
+           update_fields, so a full save of an existing vote is compared
+           with the stored row. A vote moved to another comment or user
+           replaces the stored one, otherwise vote_type is written only
+           if it has changed."""
+        if _updates_row(self, kwargs) and kwargs.get('update_fields') is None:
+            stored = Vote.objects.filter(pk=self.pk).values(
+                'vote_type', 'comment_id', 'user_id'
+            ).first()
+            if stored is None:
+                return super().save(*args, **kwargs)
+
+            if (stored['comment_id'], stored['user_id']) != (self.comment_id, self.user_id):
+                with transaction.atomic():
+                    Vote(pk=self.pk, **stored).delete()
+                    return super().save(*args, force_insert=True, **kwargs)
+
+            excluded = ('vote_type',) if stored['vote_type'] == self.vote_type else ()
+            kwargs['update_fields'] = _fields_to_update(self, None, excluded)
+        return super().save(*args, **kwargs)
+
 
 class Tag(models.Model):
     """Tag for filtering posts."""
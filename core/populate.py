@@ -0,0 +1,79 @@
+"""
+Helpers to create fake posts, shared by the populate_posts
+command and the Celery task creating posts.
+"""
+import random
+import shutil
+
+from tempfile import SpooledTemporaryFile
+from PIL import Image
+
+from django.core.files import File
+from django.utils.text import slugify
+
+from core.models import Post
+
+JPEG_SOI_MARKER = b'\xff\xd8'
+# Images smaller than this stay in memory, larger ones spill to disk
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+def download_image(session, url):
+    """Download an image into a spooled temporary file. The response
+       is streamed, so the image is never held in memory twice."""
+    image = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        with session.get(url, stream=True) as response:
+            response.raw.decode_content = True
+            shutil.copyfileobj(response.raw, image)
+    except BaseException:
+        image.close()
+        raise
+    image.seek(0)
+    return image
+
+
+def as_jpeg(image):
+    """Return an image file in the JPEG format. Images that are
+       already JPEGs are returned as they are, without re-encoding,
+       other images are closed once they are converted."""
+    is_jpeg = image.read(len(JPEG_SOI_MARKER)) == JPEG_SOI_MARKER
+    image.seek(0)
+    if is_jpeg:
+        return image
+
+    jpeg = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    with image, Image.open(image) as img:
+        img.convert('RGB').save(jpeg, format='JPEG', quality=85, optimize=False)
+    jpeg.seek(0)
+    return jpeg
+
+
+def save_cover_image(post):
+    """Write the cover image of an unsaved post to the storage,
+       so that saving the post only has to insert its row.
+       The image file is closed once it is written."""
+    cover_image = post.cover_image
+    with cover_image.file as image:
+        cover_image.save(cover_image.name, image, save=False)
+
+
+def random_tag_ids(tag_ids):
+    """Return a random sample of 1 to 5 of the given tag IDs."""
+    if not tag_ids:
+        return []
+    return random.sample(tag_ids, random.randint(1, min(5, len(tag_ids))))
+
+
+def build_fake_post(fake, author, image):
+    """Return an unsaved post with fake content and the given cover image file."""
+    title = fake.sentence(nb_words=6, variable_nb_words=True, ext_word_list=None)
+    cover_image = File(as_jpeg(image), name='image.jpg')
+    return Post(
+        title=title,
+        slug=slugify(title),
+        author=author,
+        description=fake.text(max_nb_chars=200),
+        body=fake.text(max_nb_chars=1000),
+        cover_image=cover_image,
+    )
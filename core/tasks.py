@@ -0,0 +1,35 @@
+"""
+Celery tasks for the core app.
+"""
+import requests
+
+from celery import shared_task
+from faker import Faker
+
+from django.contrib.auth import get_user_model
+
+from core.models import Tag
+from core.populate import (
+    build_fake_post,
+    download_image,
+    random_tag_ids,
+    save_cover_image,
+)
+
+
+# Acknowledged after it finishes, so a post lost with a crashed
+# worker is created again; creating one more fake post is harmless
+@shared_task(acks_late=True)
+def create_fake_post(author_id):
+    """Celery task to create one fake post with a downloaded cover image."""
+    fake = Faker()
+    author = get_user_model().objects.only('id').get(id=author_id)
+    with requests.Session() as session:
+        image = download_image(session, fake.image_url())
+
+    post = build_fake_post(fake, author, image)
+    save_cover_image(post)
+    post.save()
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+    post.tags.set(random_tag_ids(tag_ids))
+    return post.id
@@ -1,13 +1,33 @@
 """
 Tests custom Django management commands.
 """
-from unittest.mock import patch
+import tempfile
 
+from functools import partial
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.db.utils import OperationalError
 from psycopg2 import OperationalError as Psycopg2OpError
 
+from core.models import Post, Tag
+from core.tasks import create_fake_post
+
+
+def fake_image_response(*args, image_format='JPEG', **kwargs):
+    """Return a mocked streamed response with an image, a JPEG by default."""
+    image = BytesIO()
+    Image.new('RGB', (10, 10)).save(image, format=image_format)
+    image.seek(0)
+    response = MagicMock()
+    response.__enter__.return_value.raw = image
+    return response
+
 
 @patch('core.management.commands.wait_for_db.Command.check')
 class CommandTest(SimpleTestCase):
@@ -29,3 +49,72 @@ class CommandTest(SimpleTestCase):
 
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+
+@patch('requests.Session.get', side_effect=fake_image_response)
+class PopulatePostsCommandTest(TestCase):
+    """Test populate_posts command"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.bulk_create([Tag(name=f'tag {i}') for i in range(3)])
+
+    def setUp(self):
+        # Cover images are written to a temporary media root
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_populate_posts(self, patched_get):
+        """Test that the command creates posts with tags and cover images"""
+        call_command('populate_posts')
+
+        self.assertEqual(patched_get.call_count, 30)
+        self.assertEqual(Post.objects.count(), 30)
+        self.assertFalse(Post.objects.filter(tags=None).exists())
+        self.assertFalse(Post.objects.filter(cover_image='').exists())
+
+    def test_populate_posts_closes_images(self, patched_get):
+        """Test that the downloaded and converted images are closed"""
+        patched_get.side_effect = partial(fake_image_response, image_format='PNG')
+        files = []
+
+        def spooled_file(*args, **kwargs):
+            files.append(tempfile.SpooledTemporaryFile(*args, **kwargs))
+            return files[-1]
+
+        with patch('core.populate.SpooledTemporaryFile', side_effect=spooled_file):
+            call_command('populate_posts')
+
+        # one downloaded and one converted image for every post
+        self.assertEqual(len(files), 60)
+        self.assertTrue(all(file.closed for file in files))
+
+    def test_create_fake_post_task(self, patched_get):
+        """Test that the task creates one post with tags and a cover image"""
+        author = get_user_model().objects.create_user(
+            email='author@example.com',
+            password='author123',
+            username='author'
+        )
+        post_id = create_fake_post(author.id)
+
+        post = Post.objects.get(id=post_id)
+        patched_get.assert_called_once()
+        self.assertEqual(post.author, author)
+        self.assertTrue(post.cover_image)
+        self.assertTrue(post.tags.exists())
+
+    @patch('core.management.commands.populate_posts.group')
+    def test_populate_posts_with_celery(self, patched_group, patched_get):
+        """Test that --celery dispatches one task per post"""
+        call_command('populate_posts', '--celery')
+
+        patched_group.assert_called_once()
+        signatures = list(patched_group.call_args.args[0])
+        self.assertEqual(len(signatures), 30)
+        self.assertEqual(signatures[0].task, 'core.tasks.create_fake_post')
+        patched_group.return_value.apply_async.assert_called_once()
+        patched_get.assert_not_called()
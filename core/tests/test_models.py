@@ -107,14 +107,15 @@ class UserModelTests(TestCase):
 class PostModelTests(TestCase):
     """Tests for the models connected to the Post model."""
 
-    def setUp(self):
-        self.user = get_user_model().objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
             email='user@example.com',
             password='password123',
             username='user_name123'
         )
-        UserProfile.objects.create(user=self.user)
-        self.post = create_sample_post(self.user)
+        UserProfile.objects.create(user=cls.user)
+        cls.post = create_sample_post(cls.user)
 
     def test_create_post(self):
         """Test creating a post is successful."""
@@ -129,6 +130,37 @@ class PostModelTests(TestCase):
         expected_slug = slugify(title)
         self.assertEquals(expected_slug, post.slug)
 
+    def test_copy_post(self):
+        """Test that a post without a primary key is saved as a new post."""
+        post = Post.objects.get(id=self.post.id)
+        post.pk = None
+        post.title = 'Copy of the post'
+        post.slug = ''
+        post.save()
+
+        self.assertNotEqual(post.id, self.post.id)
+        self.assertEqual(Post.objects.count(), 2)
+
+    def test_save_deleted_post(self):
+        """Test that a deleted post can be saved again."""
+        post = create_sample_post(self.user, {'title': 'Deleted post'})
+        post.delete()
+        post.save()
+
+        self.assertTrue(Post.objects.filter(title='Deleted post').exists())
+
+    def test_save_post_with_deferred_fields(self):
+        """Test that saving a post with deferred fields writes only
+           the loaded fields, without fetching the deferred ones."""
+        # The slug is read by save(), so it is loaded as well
+        post = Post.objects.only('title', 'slug').get(id=self.post.id)
+        post.title = 'New title'
+        with self.assertNumQueries(1):
+            post.save()
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.title, 'New title')
+
     def test_create_tag(self):
         """Test creating a tag is successful."""
         tag = Tag.objects.create(
@@ -210,7 +242,7 @@ class PostModelTests(TestCase):
             comment=comment,
             vote_type=Vote.DOWNVOTE
         )
-        n_of_votes = Vote.objects.all().count()
+        n_of_votes = Vote.objects.count()
 
         self.assertEqual(n_of_votes, 1)
 
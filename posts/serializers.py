@@ -1,13 +1,56 @@
 """
 Serializers for the posts API.
 """
+import copy
+
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, models, transaction
+from django.utils.functional import cached_property
 from rest_framework import serializers
 
 from core.models import Post, Tag, Comment, PostImage, Vote, UserProfile
 
 
-class TagSerializer(serializers.ModelSerializer):
+class CachedFieldsMixin:
+    """Build the fields of a serializer class only once. Model
+       serializers introspect the model to build their fields
+       every time they are instantiated, the fields are the same
+       for every instance, so copies of the cached ones are used."""
+    _fields_cache = {}
+
+    def get_fields(self):
+        cls = type(self)
+        if cls not in self._fields_cache:
+            self._fields_cache[cls] = super().get_fields()
+        return copy.deepcopy(self._fields_cache[cls])
+
+    @cached_property
+    def _readable_fields(self):
+        """A nested serializer with many=True uses one child for
+           every item, so its readable fields are listed only once."""
+        return [field for field in self.fields.values() if not field.write_only]
+
+
+class CachedImageField(serializers.ImageField):
+    """Image field that builds the URL of each image only once
+       per serialization, e.g. for comments of the same author."""
+
+    def to_representation(self, value):
+        urls = self.context.setdefault('_image_urls', {})
+        if value.name not in urls:
+            urls[value.name] = super().to_representation(value)
+        return urls[value.name]
+
+
+class CachedImageFieldMixin:
+    """Use CachedImageField for the model image fields."""
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.ImageField: CachedImageField,
+    }
+
+
+class TagSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """Serializer for tag objects"""
 
     class Meta:
@@ -16,7 +59,9 @@ class TagSerializer(serializers.ModelSerializer):
         extra_kwargs = {'id': {'read_only': True}}
 
 
-class PostImageSerializer(serializers.ModelSerializer):
+class PostImageSerializer(CachedFieldsMixin,
+                          CachedImageFieldMixin,
+                          serializers.ModelSerializer):
     """Serializer for uploading images to a post."""
 
     class Meta:
@@ -29,7 +74,7 @@ class PostImageSerializer(serializers.ModelSerializer):
         }
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """Serializer for the User model."""
 
     class Meta:
@@ -37,7 +82,9 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('id', 'email', 'username', 'is_staff')
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(CachedFieldsMixin,
+                            CachedImageFieldMixin,
+                            serializers.ModelSerializer):
     """serializer for the UserProfile model."""
 
     class Meta:
@@ -48,14 +95,31 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
 class PublicUserSerializer(UserSerializer):
     """Serializer for the user model. Used for comments
-       so the other users can see specific data."""
-    user_profile = UserProfileSerializer()
+       so the other users can see specific data.
+       Profile fields are read straight from the related profile
+       instead of through a nested serializer, and nested under
+       user_profile only in the output."""
+    first_name = serializers.CharField(source='user_profile.first_name', read_only=True)
+    last_name = serializers.CharField(source='user_profile.last_name', read_only=True)
+    date_of_birth = serializers.DateField(source='user_profile.date_of_birth', read_only=True)
+    profile_image = CachedImageField(source='user_profile.profile_image', read_only=True)
+    points = serializers.IntegerField(source='user_profile.points', read_only=True)
 
     class Meta(UserSerializer.Meta):
-        fields = UserSerializer.Meta.fields + ('user_profile',)
+        fields = UserSerializer.Meta.fields + UserProfileSerializer.Meta.fields
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        user_profile = {
+            name: data.pop(name) for name in UserProfileSerializer.Meta.fields
+        }
+        # The profile fields of users without a profile are all None,
+        # such users get no nested profile, as with a nested serializer
+        data['user_profile'] = user_profile if hasattr(instance, 'user_profile') else None
+        return data
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """Serializer for adding comment to a post."""
 
     class Meta:
@@ -84,6 +148,11 @@ class GetCommentSerializer(CommentSerializer):
         read_only = True
 
     def get_has_voted(self, obj):
+        # Use the user's votes if they were prefetched with the comment,
+        # they are only prefetched for authenticated users
+        if hasattr(obj, 'user_votes'):
+            return obj.user_votes[0].vote_type if obj.user_votes else None
+
         user = self.context['request'].user
 
         if user.is_anonymous:
@@ -97,7 +166,48 @@ class GetCommentSerializer(CommentSerializer):
             return None
 
 
-class PostSerializer(serializers.ModelSerializer):
+class TagWritableMixin:
+    """Create and update posts with nested tags. Tags are matched
+       by name, the missing ones are created."""
+
+    @staticmethod
+    def _get_or_create_tags(tags, post):
+        """Handle getting or creating tags as needed. Existing tags are
+           fetched and missing ones are created in bulk."""
+        names = list(dict.fromkeys(tag['name'] for tag in tags))
+        if not names:
+            return
+
+        existing = {}
+        for tag in Tag.objects.filter(name__in=names):
+            existing.setdefault(tag.name, tag)
+        missing = Tag.objects.bulk_create([
+            Tag(name=name) for name in names if name not in existing
+        ])
+        post.tags.add(*existing.values(), *missing)
+
+    def create(self, validated_data):
+        """Create a new post."""
+        tags = validated_data.pop('tags', [])
+        post = self.Meta.model.objects.create(**validated_data)
+        self._get_or_create_tags(tags, post)
+        return post
+
+    def update(self, instance, validated_data):
+        """Update a post."""
+        tags = validated_data.pop('tags', None)
+        if tags is not None:
+            instance.tags.clear()
+            self._get_or_create_tags(tags, instance)
+
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+
+        instance.save()
+        return instance
+
+
+class PostSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """Serializer for the post model."""
     tags = TagSerializer(many=True, required=False)
     author = UserSerializer(required=False)
@@ -118,7 +228,7 @@ class PostSerializer(serializers.ModelSerializer):
         }
 
 
-class PostDetailSerializer(PostSerializer):
+class PostDetailSerializer(TagWritableMixin, PostSerializer):
     """Serialize a post details."""
     comments = GetCommentSerializer(many=True, required=False)
     images = PostImageSerializer(many=True, required=False)
@@ -131,37 +241,8 @@ class PostDetailSerializer(PostSerializer):
             'images': {'read_only': True},
         })
 
-    @staticmethod
-    def _get_or_create_tags(tags, post):
-        """Handle getting or creating tags as needed."""
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                **tag
-            )
-            post.tags.add(tag_obj)
-
-    def create(self, validated_data):
-        """Create a new recipe."""
-        tags = validated_data.pop('tags', [])
-        post = Post.objects.create(**validated_data)
-        self._get_or_create_tags(tags, post)
-        return post
-
-    def update(self, instance, validated_data):
-        """Update a post."""
-        tags = validated_data.pop('tags', None)
-        if tags is not None:
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance)
-
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
 
-        instance.save()
-        return instance
-
-
-class VoteSerializer(serializers.ModelSerializer):
+class VoteSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """Serializer for the vote model."""
     vote_type = serializers.ChoiceField(choices=Vote.VOTE_CHOICES)
 
@@ -175,22 +256,50 @@ class VoteSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         """Create a new vote."""
-        # Get the current user from the request object
-        user = self.context['request'].user
+        # The view passes the current user to save(),
+        # otherwise the user of the request votes
+        if 'user' not in validated_data:
+            validated_data['user'] = self.context['request'].user
+        user = validated_data['user']
 
         comment_id = validated_data.get('comment').id
-        vote = Vote.objects.filter(user=user, comment__id=comment_id).first()
-
-        if not vote:
-            # User has not voted for this comment yet, proceed normally
-            return Vote.objects.create(**validated_data)
-
-        # User has voted for this comment before, so check if the vote type is the same
-        if vote.vote_type == validated_data.get('vote_type'):
-            # Vote type is the same, so delete the existing vote
-            vote.delete()
-        else:
-            # Vote type is different, so update the existing vote
-            vote.delete()
-            return Vote.objects.create(**validated_data)
+
+        # Most votes are the first vote of the user for the comment,
+        # so try to insert the vote straight away. The unique
+        # constraint on the user and comment rejects a second vote.
+        try:
+            with transaction.atomic():
+                return Vote.objects.create(**validated_data)
+        except IntegrityError:
+            if not Vote.objects.filter(user=user, comment__id=comment_id).exists():
+                # Not a second vote, e.g. the comment was deleted
+                # after the data was validated
+                if not Comment.objects.filter(id=comment_id).exists():
+                    message = self.fields['comment'].error_messages['does_not_exist']
+                    raise serializers.ValidationError({
+                        'comment': [message.format(pk_value=comment_id)]
+                    })
+                raise
+
+        # Lock the existing vote, so that concurrent votes of the same
+        # user for the same comment are applied one after another
+        with transaction.atomic():
+            vote = Vote.objects.select_for_update().filter(
+                user=user,
+                comment__id=comment_id
+            ).first()
+
+            if not vote:
+                # The existing vote was deleted by a concurrent
+                # request after the insert failed, so vote again
+                return Vote.objects.create(**validated_data)
+
+            # User has voted for this comment before, so check if the vote type is the same
+            if vote.vote_type == validated_data.get('vote_type'):
+                # Vote type is the same, so delete the existing vote
+                vote.delete()
+            else:
+                # Vote type is different, so update the existing vote
+                vote.vote_type = validated_data.get('vote_type')
+                vote.save(update_fields=['vote_type'])
         return vote
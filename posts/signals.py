@@ -1,49 +1,136 @@
 """
 Signals for the posts' app.
 """
-from django.db.models.signals import pre_delete, post_save
+from django.db.models import Count, F, QuerySet
+from django.db.models.signals import pre_delete, post_delete, post_save
 from django.dispatch import receiver
 
-from core.models import Post, Vote
+from core.models import Post, Tag, UserProfile, Comment, Vote
+
+# Comment columns counting each type of vote
+VOTE_COUNTERS = {
+    Vote.UPVOTE: 'number_of_upvotes',
+    Vote.DOWNVOTE: 'number_of_downvotes',
+}
 
 
 @receiver(pre_delete, sender=Post)
 def delete_related_tags(sender, instance, **kwargs):
     """Delete tags related to the post if they are not used
        by any other post."""
-    for tag in instance.tags.all():
-        # if length is 1, that means that this tag is
-        # connected only to this one post that is being deleted
-        if len(tag.post_set.all()) == 1:
-            tag.delete()
+    # if the count is 1, that means that this tag is
+    # connected only to this one post that is being deleted
+    orphan_tags = Tag.objects.filter(
+        id__in=instance.tags.values('id')
+    ).annotate(
+        post_count=Count('post')
+    ).filter(post_count=1)
+    # Select the tags in a subquery of the delete, instead of
+    # fetching their IDs first
+    Tag.objects.filter(id__in=orphan_tags.values('id')).delete()
+
+
+def _add_comment_author_points(vote, points):
+    """Add points to the profile of the author of the voted comment,
+       in a single UPDATE so that concurrent votes are not lost."""
+    UserProfile.objects.filter(
+        user_id=vote.comment.author_id
+    ).update(points=F('points') + points)
 
 
 @receiver(post_save, sender=Vote)
-def calculate_user_points_add_vote(sender, instance, **kwargs):
+def calculate_user_points_add_vote(sender, instance, created, update_fields=None, **kwargs):
     """After saving a vote, calculate points of the user
        whose comment received a vote."""
-    comment_author_profile = instance.comment.author.user_profile
-
-    if instance.vote_type == Vote.UPVOTE:
-        comment_author_profile.points += 1
-    else:
-        comment_author_profile.points -= 1
+    points = 1 if instance.vote_type == Vote.UPVOTE else -1
 
-    comment_author_profile.save()
+    if created:
+        _add_comment_author_points(instance, points)
+    elif update_fields and 'vote_type' in update_fields:
+        # The vote was changed to the opposite one, so the points
+        # of the previous vote have to be reverted as well
+        _add_comment_author_points(instance, 2 * points)
 
 
 @receiver(pre_delete, sender=Vote)
 def calculate_user_points_delete_vote(sender, instance, **kwargs):
     """Before deleting a vote, calculate points of the user
        that has previously received a vote."""
-    comment_author_profile = instance.comment.author.user_profile
     if instance.vote_type == Vote.UPVOTE:
         # Upvote is being deleted, subtract 1 point
         # that was previously added
-        comment_author_profile.points -= 1
+        _add_comment_author_points(instance, -1)
     else:
         # Downvote is being deleted, add 1 point
         # that was previously subtracted
-        comment_author_profile.points += 1
+        _add_comment_author_points(instance, 1)
+
+
+def _add_to_counters(instance, related_name, **counters):
+    """Add to the counters of the object related to the instance in
+       a single UPDATE. If the related object is loaded, its counters
+       are updated as well, so they are not stale after the change."""
+    field = instance._meta.get_field(related_name)
+    field.related_model.objects.filter(
+        pk=getattr(instance, field.attname)
+    ).update(**{name: F(name) + value for name, value in counters.items()})
+
+    if field.is_cached(instance):
+        related = getattr(instance, related_name)
+        for name, value in counters.items():
+            setattr(related, name, getattr(related, name) + value)
+
 
-    comment_author_profile.save()
+def _deleted_with(origin, *models):
+    """Return whether the delete started from an instance
+       or a queryset of one of the models."""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, models)
+
+
+@receiver(post_save, sender=Comment)
+def count_comments_add_comment(sender, instance, created, **kwargs):
+    """After creating a comment, increase the number
+       of comments of the post."""
+    if created:
+        _add_to_counters(instance, 'post', number_of_comments=1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_comments_delete_comment(sender, instance, **kwargs):
+    """After deleting a comment, decrease the number
+       of comments of the post."""
+    if _deleted_with(kwargs.get('origin'), Post):
+        # The post is deleted as well, there is nothing to count
+        return
+    _add_to_counters(instance, 'post', number_of_comments=-1)
+
+
+@receiver(post_save, sender=Vote)
+def count_votes_add_vote(sender, instance, created, update_fields=None, **kwargs):
+    """After saving a vote, increase the number of votes
+       of its type on the comment."""
+    if created:
+        _add_to_counters(instance, 'comment', **{
+            VOTE_COUNTERS[instance.vote_type]: 1,
+        })
+    elif update_fields and 'vote_type' in update_fields:
+        # The vote was changed to the opposite one, so the
+        # previous vote has to be subtracted as well
+        opposite_type, = set(VOTE_COUNTERS) - {instance.vote_type}
+        _add_to_counters(instance, 'comment', **{
+            VOTE_COUNTERS[instance.vote_type]: 1,
+            VOTE_COUNTERS[opposite_type]: -1,
+        })
+
+
+@receiver(pre_delete, sender=Vote)
+def count_votes_delete_vote(sender, instance, **kwargs):
+    """Before deleting a vote, decrease the number of votes
+       of its type on the comment."""
+    if _deleted_with(kwargs.get('origin'), Post, Comment):
+        # The comment is deleted as well, there is nothing to count
+        return
+    _add_to_counters(instance, 'comment', **{
+        VOTE_COUNTERS[instance.vote_type]: -1,
+    })
@@ -1,6 +1,8 @@
 """
 Test for the comments API.
 """
+from functools import lru_cache
+
 from django.urls import reverse
 from django.test import TestCase
 
@@ -13,6 +15,7 @@ from .test_posts_api import create_user, create_post
 COMMENTS_URL = reverse('posts:comment-list')
 
 
+@lru_cache(maxsize=None)
 def detail_url(comment_id):
     """Create and return comment detail URL"""
     return reverse('posts:comment-detail', args=[comment_id])
@@ -29,11 +32,12 @@ def create_comment(author, post, text='Test text'):
 
 class PublicCommentsAPITests(TestCase):
     """Test for API calls without authentication."""
+    client_class = APIClient
 
-    def setUp(self):
-        self.client = APIClient()
-        self.user = create_user(is_staff=True)
-        self.post = create_post(self.user)
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(is_staff=True)
+        cls.post = create_post(cls.user)
 
     def test_create_comment_without_auth_error(self):
         """Test that trying to create a comment without auth raises an error."""
@@ -66,12 +70,15 @@ class PublicCommentsAPITests(TestCase):
 
 class PrivateCommentsAPITests(TestCase):
     """Test for API calls that require authentication."""
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(is_staff=False)
+        cls.post = create_post(cls.user)
 
     def setUp(self):
-        self.client = APIClient()
-        self.user = create_user(is_staff=False)
         self.client.force_authenticate(self.user)
-        self.post = create_post(self.user)
 
     def test_create_comment_success(self):
         """Test creating a comment is successful."""
@@ -92,7 +99,9 @@ class PrivateCommentsAPITests(TestCase):
         url = detail_url(comment.id)
         payload = {'text': 'new comment text'}
 
-        res = self.client.patch(url, payload, format='json')
+        # the comment is fetched once and updated
+        with self.assertNumQueries(2):
+            res = self.client.patch(url, payload, format='json')
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data['text'], payload['text'])
@@ -1,9 +1,9 @@
 """
 Test for the post images API.
 """
-import tempfile
+from functools import lru_cache
 
-from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 from django.test import TestCase
 
@@ -11,11 +11,12 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 from core.models import PostImage
-from .test_posts_api import create_user, create_post
+from .test_posts_api import create_user, create_post, create_jpeg_bytes
 
 POST_IMAGES_URL = reverse('posts:postimage-list')
 
 
+@lru_cache(maxsize=None)
 def detail_url(post_image_id):
     """Create and return post image detail URL."""
     return reverse('posts:postimage-detail', args=[post_image_id])
@@ -23,12 +24,16 @@ def detail_url(post_image_id):
 
 class PublicPostImagesAPITests(TestCase):
     """Test for API calls without authentication."""
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(is_staff=False)
+        cls.post = create_post(cls.user)
+        cls.jpeg_bytes = create_jpeg_bytes()
 
     def setUp(self):
-        self.client = APIClient()
-        self.user = create_user(is_staff=False)
         self.client.force_authenticate(self.user)
-        self.post = create_post(self.user)
 
     def test_create_post_image_no_auth_not_allowed(self):
         """Test that creating a post image without being a staff
@@ -37,12 +42,12 @@ class PublicPostImagesAPITests(TestCase):
             'title': 'image title',
             'post': self.post.id
         }
-        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
-            img = Image.new('RGB', (10, 10))
-            img.save(image_file, format='JPEG')
-            image_file.seek(0)
-            payload['image'] = image_file
-            res = self.client.post(POST_IMAGES_URL, payload, format='multipart')
+        payload['image'] = SimpleUploadedFile(
+            'image.jpg',
+            self.jpeg_bytes,
+            content_type='image/jpeg'
+        )
+        res = self.client.post(POST_IMAGES_URL, payload, format='multipart')
 
         self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
 
@@ -70,13 +75,17 @@ class PublicPostImagesAPITests(TestCase):
 
 class StaffPostImagesAPITests(TestCase):
     """Test for API calls that require is_staff set to True."""
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(is_staff=True)
+        cls.post = create_post(cls.user)
+        cls.post_image = PostImage.objects.create(post=cls.post, title='title')
+        cls.jpeg_bytes = create_jpeg_bytes()
 
     def setUp(self):
-        self.client = APIClient()
-        self.user = create_user(is_staff=True)
         self.client.force_authenticate(self.user)
-        self.post = create_post(self.user)
-        self.post_image = PostImage.objects.create(post=self.post, title='title')
 
     def test_create_post_image_success(self):
         """Test that creating a post image is successful."""
@@ -84,12 +93,12 @@ class StaffPostImagesAPITests(TestCase):
             'title': 'image title',
             'post': self.post.id
         }
-        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
-            img = Image.new('RGB', (10, 10))
-            img.save(image_file, format='JPEG')
-            image_file.seek(0)
-            payload['image'] = image_file
-            res = self.client.post(POST_IMAGES_URL, payload, format='multipart')
+        payload['image'] = SimpleUploadedFile(
+            'image.jpg',
+            self.jpeg_bytes,
+            content_type='image/jpeg'
+        )
+        res = self.client.post(POST_IMAGES_URL, payload, format='multipart')
 
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
         self.assertIn('image', res.data)
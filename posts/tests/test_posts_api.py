@@ -1,38 +1,52 @@
 """
 Test for the posts API.
 """
-import tempfile
+from functools import lru_cache
+from io import BytesIO
 from PIL import Image
 
 from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 from django.utils.text import slugify
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Post, UserProfile, Comment, PostImage
+from core.models import Post, UserProfile, Comment, PostImage, Tag, Vote
+from posts.views import MAX_POST_COMMENTS
 
 POSTS_URL = reverse('posts:post-list')
 
 
+@lru_cache(maxsize=None)
 def detail_url(post_id):
     """Create and return post detail URL"""
     return reverse('posts:post-detail', args=[post_id])
 
 
+@lru_cache(maxsize=None)
+def create_jpeg_bytes():
+    """Create and return bytes of a small JPEG image.
+       The image is encoded only once and the bytes are reused."""
+    buffer = BytesIO()
+    Image.new('RGB', (10, 10)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
 def create_user(is_staff, **params):
     """Create and return a new user."""
     default_details = {
         'email': 'user@example.com',
         'password': '123123',
-        'username': 'user123'
+        'username': 'user123',
+        'is_staff': is_staff,
     }
     default_details.update(params)
+    # is_staff is saved with the user, so that it is kept
+    # when the user is fetched from the database again
     user = get_user_model().objects.create_user(**default_details)
-    if is_staff:
-        user.is_staff = True
     UserProfile.objects.create(user=user)
     return user
 
@@ -48,26 +62,25 @@ def create_post(user, **params):
     return Post.objects.create(author=user, **default_params)
 
 
-class PublicPostsAPITests(TestCase):
-    """Test unauthenticated posts API requests."""
-
-    def setUp(self):
-        self.client = APIClient()
-        self.user = create_user(is_staff=True)
-        self.post = create_post(self.user)
-
-    def test_get_posts_success(self):
-        """Test that retrieving a post list is successful without auth."""
-        res = self.client.get(POSTS_URL)
-        results = res.data['results']
+def bulk_create_posts(user, titles):
+    """Create and return posts with the given titles in one query."""
+    return Post.objects.bulk_create([
+        Post(
+            author=user,
+            title=title,
+            slug=slugify(title),
+            description='Test post description',
+            body='Test post body',
+        )
+        for title in titles
+    ])
 
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(results), 1)
-        self.assertEqual(res.data['count'], 1)
-        self.assertIn('number_of_comments', results[0])
 
-        # body should be only in post details
-        self.assertNotIn('body', results[0])
+class AuthRequiredPostsAPITests(SimpleTestCase):
+    """Test that posts API requests which change data require auth.
+       Authentication is checked before any post is fetched,
+       so these tests do not need the database."""
+    client_class = APIClient
 
     def test_auth_required_to_post(self):
         """Test that authentication is required to make
@@ -79,7 +92,7 @@ class PublicPostsAPITests(TestCase):
     def test_auth_required_to_patch(self):
         """Test that authentication is required to make
            PATCH requests to post-details endpoint."""
-        url = detail_url(self.post.id)
+        url = detail_url(1)
         res = self.client.patch(url, {})
 
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -87,16 +100,64 @@ class PublicPostsAPITests(TestCase):
     def test_auth_required_to_delete(self):
         """Test that authentication is required to make
            DELETE requests to post-details endpoint."""
-        url = detail_url(self.post.id)
+        url = detail_url(1)
         res = self.client.delete(url)
 
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
+
+class PublicPostsAPITests(TestCase):
+    """Test unauthenticated posts API requests."""
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(is_staff=True)
+        cls.post = create_post(cls.user)
+
+    def test_get_posts_success(self):
+        """Test that retrieving a post list is successful without auth."""
+        # count, page of posts with their authors and tags of the page
+        with self.assertNumQueries(3):
+            res = self.client.get(POSTS_URL)
+        results = res.data['results']
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(res.data['count'], 1)
+        self.assertIn('number_of_comments', results[0])
+
+        # body should be only in post details
+        self.assertNotIn('body', results[0])
+
+    def test_get_post_details_not_an_id(self):
+        """Test fetching post details with a pk that
+           is not a post ID returns 404."""
+        res = self.client.get(detail_url('abc'))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_post_details_comment_author_without_profile(self):
+        """Test that the author of a comment who has no profile,
+           e.g. a superuser, is returned without one."""
+        author = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='admin123',
+            username='admin'
+        )
+        Comment.objects.create(text='comment', author=author, post=self.post)
+        res = self.client.get(detail_url(self.post.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data['comments'][0]['author']['user_profile'])
+
     def test_get_post_details_success(self):
         """Test fetching post details is successful,
            and returns all fields"""
         url = detail_url(self.post.id)
-        res = self.client.get(url)
+        # post with its author, tags, comments and images
+        with self.assertNumQueries(4):
+            res = self.client.get(url)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data['title'], self.post.title)
@@ -115,11 +176,31 @@ class PublicPostsAPITests(TestCase):
             author=self.user,
             post=self.post
         )
-        res = self.client.get(POSTS_URL)
+        with self.assertNumQueries(3):
+            res = self.client.get(POSTS_URL)
         post = res.data['results'][0]
 
         self.assertEqual(post['number_of_comments'], 1)
 
+    def test_get_posts_number_of_queries(self):
+        """Test that the number of queries made to list posts
+           does not grow with the number of posts."""
+        tag = Tag.objects.create(name='tag')
+        posts = bulk_create_posts(self.user, ['post 1', 'post 2', 'post 3'])
+        for post in posts:
+            post.tags.add(tag)
+            Comment.objects.create(text='comment', author=self.user, post=post)
+
+        # count, page of posts with their authors and tags of the page
+        with self.assertNumQueries(3):
+            res = self.client.get(POSTS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 4)
+        for result in res.data['results'][:3]:
+            self.assertEqual(result['number_of_comments'], 1)
+            self.assertEqual(len(result['tags']), 1)
+
     def test_get_posts_comments(self):
         """Test that comments are returned with the post details."""
         comment = Comment.objects.create(
@@ -137,6 +218,50 @@ class PublicPostsAPITests(TestCase):
         self.assertEqual(comments[0]['author']['id'], comment.author.id)
         self.assertEqual(comments[0]['text'], comment.text)
 
+    def test_get_post_details_newest_comments(self):
+        """Test that only the newest comments are returned
+           with the post details."""
+        oldest_comment = Comment.objects.create(
+            text='oldest comment',
+            post=self.post,
+            author=self.user
+        )
+        Comment.objects.bulk_create([
+            Comment(text=f'comment {i}', post=self.post, author=self.user)
+            for i in range(MAX_POST_COMMENTS)
+        ])
+        url = detail_url(self.post.id)
+        res = self.client.get(url)
+
+        comments = res.data['comments']
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(comments), MAX_POST_COMMENTS)
+        self.assertNotIn(oldest_comment.id, [c['id'] for c in comments])
+
+    def test_get_posts_comments_votes(self):
+        """Test that comments in the post details include vote counts."""
+        comment = Comment.objects.create(
+            text='comment test',
+            post=self.post,
+            author=self.user
+        )
+        other_user = create_user(
+            is_staff=False,
+            email='other@example.com',
+            username='other123'
+        )
+        Vote.objects.create(user=self.user, comment=comment, vote_type=Vote.UPVOTE)
+        Vote.objects.create(user=other_user, comment=comment, vote_type=Vote.DOWNVOTE)
+        url = detail_url(self.post.id)
+        res = self.client.get(url)
+
+        comments = res.data['comments']
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(comments[0]['number_of_upvotes'], 1)
+        self.assertEqual(comments[0]['number_of_downvotes'], 1)
+
     def test_get_posts_images(self):
         """Test that post images are returned with the post details."""
         post_image = PostImage.objects.create(title='title', post=self.post)
@@ -152,12 +277,12 @@ class PublicPostsAPITests(TestCase):
 
 class SortPostsTests(TestCase):
     """Test for API calls that use sorting of posts."""
+    client_class = APIClient
 
-    def setUp(self):
-        self.client = APIClient()
-        self.user = create_user(is_staff=True)
-        self.post_1 = create_post(self.user, title='post 1')
-        self.post_2 = create_post(self.user, title='post 2')
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(is_staff=True)
+        cls.post_1, cls.post_2 = bulk_create_posts(cls.user, ['post 1', 'post 2'])
 
     def test_sorting_posts_by_comments(self):
         """Test sorting posts by comments in ascending and descending order."""
@@ -166,7 +291,9 @@ class SortPostsTests(TestCase):
             author=self.user,
             post=self.post_1
         )
-        res_asc = self.client.get(POSTS_URL, {'sort': 'comments-asc'})
+        # count, sorted page of posts with their authors and tags of the page
+        with self.assertNumQueries(3):
+            res_asc = self.client.get(POSTS_URL, {'sort': 'comments-asc'})
         results_asc = res_asc.data['results']
 
         self.assertGreater(
@@ -174,7 +301,8 @@ class SortPostsTests(TestCase):
             results_asc[0]['number_of_comments']
         )
 
-        res_desc = self.client.get(POSTS_URL, {'sort': 'comments-desc'})
+        with self.assertNumQueries(3):
+            res_desc = self.client.get(POSTS_URL, {'sort': 'comments-desc'})
         results_desc = res_desc.data['results']
 
         self.assertGreater(
@@ -182,67 +310,42 @@ class SortPostsTests(TestCase):
             results_desc[1]['number_of_comments']
         )
 
-    def tst_sorting_by_title(self):
-        res_asc = self.client.get(POSTS_URL, {'sort': 'title-asc'})
-        results_asc = res_asc.data['results']
-
-        self.assertGreater(
-            results_asc[1]['title'],
-            results_asc[0]['title']
-        )
+    def assert_posts_sorted(self, sort, field, reverse=False):
+        """Assert that the posts listed with the given sort
+           parameter are sorted by the given field."""
+        res = self.client.get(POSTS_URL, {'sort': sort})
+        values = [post[field] for post in res.data['results']]
 
-        res_desc = self.client.get(POSTS_URL, {'sort': 'title-desc'})
-        results_desc = res_desc.data['results']
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(values), 2)
+        self.assertEqual(values, sorted(values, reverse=reverse))
 
-        self.assertGreater(
-            results_desc[0]['title'],
-            results_desc[1]['title']
-        )
+    def test_sorting_posts_by_title(self):
+        """Test sorting posts by title in ascending and descending order."""
+        self.assert_posts_sorted('title-asc', 'title')
+        self.assert_posts_sorted('title-desc', 'title', reverse=True)
 
-    def tst_sorting_posts_by_date(self):
+    def test_sorting_posts_by_date(self):
         """Test sorting posts by date (created_at)
            in ascending and descending order."""
-        res_asc = self.client.get(POSTS_URL, {'sort': 'date-asc'})
-        results_asc = res_asc.data['results']
-
-        self.assertGreater(
-            results_asc[1]['created_at'],
-            results_asc[0]['created_at']
-        )
+        self.assert_posts_sorted('date-asc', 'created_at')
+        self.assert_posts_sorted('date-desc', 'created_at', reverse=True)
 
-        res_desc = self.client.get(POSTS_URL, {'sort': 'date-desc'})
-        results_desc = res_desc.data['results']
-
-        self.assertGreater(
-            results_desc[0]['created_at'],
-            results_desc[1]['created_at']
-        )
-
-    def tst_sorting_posts_by_update(self):
+    def test_sorting_posts_by_update(self):
         """Test sorting posts by updated_at in ascending and descending order."""
-        res_asc = self.client.get(POSTS_URL, {'sort': 'update-asc'})
-        results_asc = res_asc.data['results']
-
-        self.assertGreater(
-            results_asc[1]['updated_at'],
-            results_asc[0]['updated_at']
-        )
-
-        res_desc = self.client.get(POSTS_URL, {'sort': 'update-desc'})
-        results_desc = res_desc.data['results']
-
-        self.assertGreater(
-            results_desc[0]['updated_at'],
-            results_desc[1]['updated_at']
-        )
+        self.assert_posts_sorted('update-asc', 'updated_at')
+        self.assert_posts_sorted('update-desc', 'updated_at', reverse=True)
 
 
 class StaffPostsAPITests(TestCase):
     """Test for API calls that require is_staff set to True."""
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user(is_staff=True)
 
     def setUp(self):
-        self.client = APIClient()
-        self.admin = create_user(is_staff=True)
         self.client.force_authenticate(self.admin)
 
     def test_create_post_success(self):
@@ -252,12 +355,12 @@ class StaffPostsAPITests(TestCase):
             'description': 'post description',
             'body': 'body'
         }
-        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
-            img = Image.new('RGB', (10, 10))
-            img.save(image_file, format='JPEG')
-            image_file.seek(0)
-            payload['cover_image'] = image_file
-            res = self.client.post(POSTS_URL, payload, format='multipart')
+        payload['cover_image'] = SimpleUploadedFile(
+            'image.jpg',
+            create_jpeg_bytes(),
+            content_type='image/jpeg'
+        )
+        res = self.client.post(POSTS_URL, payload, format='multipart')
 
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
         self.assertEqual(res.data['title'], payload['title'])
@@ -284,6 +387,48 @@ class StaffPostsAPITests(TestCase):
         self.assertEqual(res.data['tags'][0]['name'], payload['tags'][0]['name'])
         self.assertEqual(res.data['tags'][1]['name'], payload['tags'][1]['name'])
 
+    def test_update_post_reuses_existing_tags(self):
+        """Test that updating a post assigns existing tags
+           instead of creating duplicates."""
+        tag = Tag.objects.create(name='tag1')
+        post = create_post(user=self.admin)
+        payload = {
+            'tags': [
+                {'name': 'tag1'},
+                {'name': 'tag2'},
+                {'name': 'tag2'}
+            ]
+        }
+        url = detail_url(post.id)
+        res = self.client.patch(url, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertIn(tag, post.tags.all())
+        self.assertEqual(post.tags.count(), 2)
+
+    def test_get_post_details_has_voted(self):
+        """Test that comments in the post details show the user's vote."""
+        post = create_post(user=self.admin)
+        voted_comment = Comment.objects.create(
+            text='voted comment',
+            post=post,
+            author=self.admin
+        )
+        Comment.objects.create(text='other comment', post=post, author=self.admin)
+        Vote.objects.create(
+            user=self.admin,
+            comment=voted_comment,
+            vote_type=Vote.UPVOTE
+        )
+        res = self.client.get(detail_url(post.id))
+
+        votes = {c['id']: c['has_voted'] for c in res.data['comments']}
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(votes.pop(voted_comment.id), Vote.UPVOTE)
+        self.assertEqual(list(votes.values()), [None])
+
     def test_delete_post_success(self):
         """Test that deleting a post is successful."""
         post = create_post(user=self.admin)
@@ -292,4 +437,11 @@ class StaffPostsAPITests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
         post_exists = Post.objects.filter(id=post.id).exists()
-        self.assertFalse(post_exists)
\ No newline at end of file
+        self.assertFalse(post_exists)
+
+    def test_delete_post_not_an_id(self):
+        """Test deleting a post with a pk that is
+           not a post ID returns 404."""
+        res = self.client.delete(detail_url('abc'))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
\ No newline at end of file
@@ -1,26 +1,36 @@
 """
 Tests for signals in posts app.
 """
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from core.models import Post, Tag, Comment, Vote, UserProfile
+from posts.serializers import CommentSerializer, PostDetailSerializer
 from .test_posts_api import create_post, create_user
 
 
 class DeleteRelatedTagsSignalTest(TestCase):
     """Tests for the delete related tags signal."""
 
-    def setUp(self):
+    @classmethod
+    def setUpTestData(cls):
         # create a Post and two Tags
-        self.user = create_user(is_staff=True)
-        self.post = create_post(self.user)
-        self.tag1 = Tag.objects.create(name='Tag 1')
-        self.tag2 = Tag.objects.create(name='Tag 2')
+        cls.user = create_user(is_staff=True)
+        cls.post = create_post(cls.user)
+        cls.tag1, cls.tag2 = Tag.objects.bulk_create([
+            Tag(name='Tag 1'),
+            Tag(name='Tag 2'),
+        ])
         # Connect the tags to the post
-        self.post.tags.add(self.tag1, self.tag2)
+        cls.post.tags.add(cls.tag1, cls.tag2)
 
     def test_delete_related_tags(self):
         """Test deleting related tags is successful."""
-        self.post.delete()
+        # comments of the post, the unused tags, deleting the unused
+        # tags with their post links and deleting the post with its
+        # tag links and images; none of these repeats per tag
+        with self.assertNumQueries(7):
+            self.post.delete()
 
         self.assertFalse(Tag.objects.filter(name=self.tag1.name).exists())
         self.assertFalse(Tag.objects.filter(name=self.tag2.name).exists())
@@ -35,80 +45,294 @@ class DeleteRelatedTagsSignalTest(TestCase):
         # assert that only one tag is deleted
         self.assertTrue(Tag.objects.filter(name=self.tag1.name).exists())
         self.assertFalse(Tag.objects.filter(name=self.tag2.name).exists())
-        self.assertEqual(len(self.tag1.post_set.all()), 1)
+        self.assertEqual(self.tag1.post_set.count(), 1)
 
 
 class CalculateUsersPointsSignalsTest(TestCase):
     """Tests for the calculate user points signals."""
 
-    def setUp(self):
-        self.comment_author = create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.comment_author = create_user(
             is_staff=False,
             email='author@example.com',
             username='author'
         )
-        self.post = create_post(self.comment_author)
-        self.comment = Comment.objects.create(
+        cls.post = create_post(cls.comment_author)
+        cls.comment = Comment.objects.create(
             text='test comment',
-            author=self.comment_author,
-            post=self.post
+            author=cls.comment_author,
+            post=cls.post
+        )
+        cls.user = create_user(is_staff=False)
+        # The tests only read the points of the profile
+        cls.author_profile = UserProfile.objects.only('points').get(
+            user=cls.comment_author
         )
-        self.user = create_user(is_staff=False)
 
     def test_user_points_add_upvote(self):
         """Test that after upvote, user's points increase."""
-        points_before_vote = UserProfile.objects.get(user=self.comment_author).points
+        points_before_vote = self.author_profile.points
 
         vote = Vote.objects.create(
             user=self.user,
             comment=self.comment,
             vote_type=Vote.UPVOTE
         )
-        points_after_vote = UserProfile.objects.get(user=self.comment_author).points
+        self.author_profile.refresh_from_db(fields=['points'])
+        points_after_vote = self.author_profile.points
 
         self.assertEqual(points_before_vote + 1, points_after_vote)
 
     def test_user_points_add_downvote(self):
         """Test that after downvote, user's points decrease."""
-        points_before_vote = UserProfile.objects.get(user=self.comment_author).points
+        points_before_vote = self.author_profile.points
 
         vote = Vote.objects.create(
             user=self.user,
             comment=self.comment,
             vote_type=Vote.DOWNVOTE
         )
-        points_after_vote = UserProfile.objects.get(user=self.comment_author).points
+        self.author_profile.refresh_from_db(fields=['points'])
+        points_after_vote = self.author_profile.points
 
         self.assertEqual(points_before_vote - 1, points_after_vote)
 
     def test_user_points_delete_upvote(self):
         """Test that after deleting an upvote, user's points decrease."""
-        points_before_vote = UserProfile.objects.get(user=self.comment_author).points
+        points_before_vote = self.author_profile.points
 
         vote = Vote.objects.create(
             user=self.user,
             comment=self.comment,
             vote_type=Vote.UPVOTE
         )
-        points_after_vote = UserProfile.objects.get(user=self.comment_author).points
+        self.author_profile.refresh_from_db(fields=['points'])
+        points_after_vote = self.author_profile.points
 
         self.assertEqual(points_before_vote + 1, points_after_vote)
         vote.delete()
-        points_after_vote_delete = UserProfile.objects.get(user=self.comment_author).points
+        self.author_profile.refresh_from_db(fields=['points'])
+        points_after_vote_delete = self.author_profile.points
         self.assertEqual(points_before_vote, points_after_vote_delete)
 
     def test_user_points_delete_downvote(self):
         """Test that after deleting a downvote, user's points increase."""
-        points_before_vote = UserProfile.objects.get(user=self.comment_author).points
+        points_before_vote = self.author_profile.points
 
         vote = Vote.objects.create(
             user=self.user,
             comment=self.comment,
             vote_type=Vote.DOWNVOTE
         )
-        points_after_vote = UserProfile.objects.get(user=self.comment_author).points
+        self.author_profile.refresh_from_db(fields=['points'])
+        points_after_vote = self.author_profile.points
 
         self.assertEqual(points_before_vote - 1, points_after_vote)
         vote.delete()
-        points_after_vote_delete = UserProfile.objects.get(user=self.comment_author).points
+        self.author_profile.refresh_from_db(fields=['points'])
+        points_after_vote_delete = self.author_profile.points
         self.assertEqual(points_before_vote, points_after_vote_delete)
+
+    def test_user_points_change_vote(self):
+        """Test that changing an upvote to a downvote reverts
+           the upvote point and subtracts one."""
+        points_before_vote = self.author_profile.points
+
+        vote = Vote.objects.create(
+            user=self.user,
+            comment=self.comment,
+            vote_type=Vote.UPVOTE
+        )
+        vote.vote_type = Vote.DOWNVOTE
+        vote.save(update_fields=['vote_type'])
+        self.author_profile.refresh_from_db(fields=['points'])
+        points_after_change = self.author_profile.points
+
+        self.assertEqual(points_before_vote - 1, points_after_change)
+
+    def test_user_points_move_vote_full_save(self):
+        """Test that moving a vote to a comment of another author
+           with a full save moves the points as well."""
+        other_author = create_user(
+            is_staff=False,
+            email='other@example.com',
+            username='other'
+        )
+        other_comment = Comment.objects.create(
+            text='other comment',
+            author=other_author,
+            post=self.post
+        )
+        points_before_vote = self.author_profile.points
+
+        vote = Vote.objects.create(
+            user=self.user,
+            comment=self.comment,
+            vote_type=Vote.UPVOTE
+        )
+        vote.comment = other_comment
+        vote.save()
+        self.author_profile.refresh_from_db(fields=['points'])
+
+        self.assertEqual(points_before_vote, self.author_profile.points)
+        other_profile = UserProfile.objects.only('points').get(user=other_author)
+        self.assertEqual(other_profile.points, 1)
+
+    def test_user_points_change_vote_full_save(self):
+        """Test that changing a vote with a full save, e.g. in the admin,
+           updates the points, and saving it unchanged does not."""
+        points_before_vote = self.author_profile.points
+
+        vote = Vote.objects.create(
+            user=self.user,
+            comment=self.comment,
+            vote_type=Vote.UPVOTE
+        )
+        vote.vote_type = Vote.DOWNVOTE
+        vote.save()
+        vote.save()
+        self.author_profile.refresh_from_db(fields=['points'])
+
+        self.assertEqual(points_before_vote - 1, self.author_profile.points)
+
+
+class CountersSignalsTest(TestCase):
+    """Tests for the signals counting comments and votes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(is_staff=False)
+        cls.post = create_post(cls.user)
+        cls.comment = Comment.objects.create(
+            text='test comment',
+            author=cls.user,
+            post=cls.post
+        )
+
+    def test_number_of_comments(self):
+        """Test that creating and deleting comments updates the post."""
+        other_comment = Comment.objects.create(
+            text='other comment',
+            author=self.user,
+            post=self.post
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.number_of_comments, 2)
+
+        other_comment.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.number_of_comments, 1)
+
+    def test_delete_post_does_not_update_counters(self):
+        """Test that deleting a post does not update the counters
+           of the post and comments that are deleted with it."""
+        comments = Comment.objects.bulk_create([
+            Comment(text=f'comment {i}', author=self.user, post=self.post)
+            for i in range(5)
+        ])
+        Vote.objects.bulk_create([
+            Vote(user=self.user, comment=comment, vote_type=Vote.UPVOTE)
+            for comment in comments
+        ])
+        with CaptureQueriesContext(connection) as queries:
+            self.post.delete()
+
+        counter_updates = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith(('UPDATE "core_post"', 'UPDATE "core_comment"'))
+        ]
+        self.assertEqual(counter_updates, [])
+
+    def test_number_of_votes(self):
+        """Test that creating, changing and deleting a vote
+           updates the comment."""
+        vote = Vote.objects.create(
+            user=self.user,
+            comment=self.comment,
+            vote_type=Vote.UPVOTE
+        )
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.number_of_upvotes, 1)
+        self.assertEqual(self.comment.number_of_downvotes, 0)
+
+        vote.vote_type = Vote.DOWNVOTE
+        vote.save(update_fields=['vote_type'])
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.number_of_upvotes, 0)
+        self.assertEqual(self.comment.number_of_downvotes, 1)
+
+        vote.delete()
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.number_of_upvotes, 0)
+        self.assertEqual(self.comment.number_of_downvotes, 0)
+
+    def test_number_of_votes_change_vote_full_save(self):
+        """Test that changing a vote with a full save updates the comment."""
+        vote = Vote.objects.create(
+            user=self.user,
+            comment=self.comment,
+            vote_type=Vote.UPVOTE
+        )
+        vote.vote_type = Vote.DOWNVOTE
+        vote.save()
+        self.comment.refresh_from_db()
+
+        self.assertEqual(self.comment.number_of_upvotes, 0)
+        self.assertEqual(self.comment.number_of_downvotes, 1)
+
+    def test_number_of_votes_move_vote_full_save(self):
+        """Test that moving a vote to another comment with a full save
+           updates both comments."""
+        other_comment = Comment.objects.create(
+            text='other comment',
+            author=self.user,
+            post=self.post
+        )
+        vote = Vote.objects.create(
+            user=self.user,
+            comment=self.comment,
+            vote_type=Vote.UPVOTE
+        )
+        vote.comment = other_comment
+        vote.save()
+        self.comment.refresh_from_db()
+        other_comment.refresh_from_db()
+
+        self.assertEqual(self.comment.number_of_upvotes, 0)
+        self.assertEqual(other_comment.number_of_upvotes, 1)
+        self.assertEqual(Vote.objects.get().id, vote.id)
+
+    def test_update_stale_comment_keeps_votes(self):
+        """Test that updating a comment loaded before a vote
+           does not overwrite the number of votes."""
+        stale_comment = Comment.objects.get(id=self.comment.id)
+        Vote.objects.create(
+            user=self.user,
+            comment=self.comment,
+            vote_type=Vote.UPVOTE
+        )
+        serializer = CommentSerializer(stale_comment, {'text': 'edited'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.comment.refresh_from_db()
+
+        self.assertEqual(self.comment.text, 'edited')
+        self.assertEqual(self.comment.number_of_upvotes, 1)
+
+    def test_update_stale_post_keeps_comments(self):
+        """Test that updating a post loaded before a comment
+           does not overwrite the number of comments."""
+        stale_post = Post.objects.get(id=self.post.id)
+        Comment.objects.create(
+            text='other comment',
+            author=self.user,
+            post=self.post
+        )
+        serializer = PostDetailSerializer(stale_post, {'title': 'edited'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.post.refresh_from_db()
+
+        self.assertEqual(self.post.title, 'edited')
+        self.assertEqual(self.post.number_of_comments, 2)
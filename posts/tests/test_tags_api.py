@@ -1,8 +1,10 @@
 """
 Tests for the tags API.
 """
+from functools import lru_cache
+
 from django.urls import reverse
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 
 from rest_framework import status
 from rest_framework.test import APIClient
@@ -15,6 +17,7 @@ TAGS_URL = reverse('posts:tag-list')
 POSTS_URL = reverse('posts:post-list')
 
 
+@lru_cache(maxsize=None)
 def detail_url(tag_id):
     """Create and return tag details url."""
     return reverse('posts:tag-detail', args=[tag_id])
@@ -27,9 +30,7 @@ def create_tag(name='test tag'):
 
 class PublicTagsAPITests(TestCase):
     """TEst unauthenticated tag API requests"""
-
-    def setUp(self):
-        self.client = APIClient()
+    client_class = APIClient
 
     def test_retrieve_all_tags(self):
         """Test retrieving all tags without auth is successful."""
@@ -51,6 +52,13 @@ class PublicTagsAPITests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
 
+
+class AuthRequiredTagsAPITests(SimpleTestCase):
+    """Test that tags API requests which change data require auth.
+       Authentication is checked before any tag is fetched,
+       so these tests do not need the database."""
+    client_class = APIClient
+
     def test_auth_required_to_post(self):
         """Test that authentication is required to make
            POST request to tags endpoint."""
@@ -61,8 +69,7 @@ class PublicTagsAPITests(TestCase):
     def test_auth_required_to_patch(self):
         """Test that authentication is required to make
            PATCH request to tag-details endpoint."""
-        tag = create_tag()
-        url = detail_url(tag.id)
+        url = detail_url(1)
         res = self.client.patch(url, {})
 
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -70,8 +77,7 @@ class PublicTagsAPITests(TestCase):
     def test_auth_required_to_delete(self):
         """Test that authentication is required to make
            DELETE request to tag-details endpoint."""
-        tag = create_tag()
-        url = detail_url(tag.id)
+        url = detail_url(1)
         res = self.client.delete(url)
 
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -79,10 +85,13 @@ class PublicTagsAPITests(TestCase):
 
 class StaffTagsAPITests(TestCase):
     """Test for API calls that require is_staff set to True."""
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user(is_staff=True)
 
     def setUp(self):
-        self.client = APIClient()
-        self.admin = create_user(is_staff=True)
         self.client.force_authenticate(self.admin)
 
     def test_update_tag_success(self):
@@ -116,9 +125,51 @@ class StaffTagsAPITests(TestCase):
         post = create_post(user=self.admin)
         post.tags.add(tag_1)
 
-        res = self.client.get(POSTS_URL, {'tags': tag_1.id})
+        # count, page of filtered posts and tags of the page
+        with self.assertNumQueries(3):
+            res = self.client.get(POSTS_URL, {'tags': tag_1.id})
         post_data = res.data['results'][0]
 
         self.assertEqual(len(post_data['tags']), 1)
         self.assertEqual(post_data['tags'][0]['id'], tag_1.id)
         self.assertEqual(post_data['tags'][0]['name'], tag_1.name)
+
+    def test_filter_posts_by_several_tags(self):
+        """Test that a post with several of the filtered tags
+           is listed once."""
+        tag_1 = create_tag(name='tag 1')
+        tag_2 = create_tag(name='tag 2')
+        post = create_post(user=self.admin)
+        post.tags.add(tag_1, tag_2)
+
+        res = self.client.get(POSTS_URL, {'tags': f'{tag_1.id},{tag_2.id}'})
+
+        self.assertEqual(res.data['count'], 1)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['id'], post.id)
+
+    def test_filter_posts_skips_invalid_tag_ids(self):
+        """Test that values of the tags filter that are not IDs
+           are skipped."""
+        tag = create_tag()
+        post = create_post(user=self.admin)
+        post.tags.add(tag)
+
+        res = self.client.get(POSTS_URL, {'tags': f'{tag.id},abc,'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 1)
+        self.assertEqual(res.data['results'][0]['id'], post.id)
+
+    def test_filter_posts_without_valid_tag_ids(self):
+        """Test that a tags filter without any tag IDs is not applied,
+           as if no tags were given."""
+        tag = create_tag()
+        post = create_post(user=self.admin)
+        post.tags.add(tag)
+        create_post(user=self.admin, title='Post without tags')
+
+        res = self.client.get(POSTS_URL, {'tags': 'abc'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 2)
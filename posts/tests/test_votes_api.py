@@ -1,20 +1,27 @@
 """
 Tests for the votes API.
 """
+from functools import lru_cache
+from unittest.mock import patch
+
+from django.db import IntegrityError
 from django.urls import reverse
 from django.test import TestCase, TransactionTestCase
 from django.test.signals import setting_changed
 
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient, APIRequestFactory
 
 from core.models import Vote
+from posts.serializers import VoteSerializer
 from .test_posts_api import create_user, create_post
 from .test_comments_api import create_comment
 
 VOTES_URL = reverse('posts:vote-list')
 
 
+@lru_cache(maxsize=None)
 def detail_url(vote_id):
     """Create and return vote detail URL."""
     return reverse('posts:vote-detail', args=[vote_id])
@@ -31,12 +38,13 @@ def create_vote(user, comment, vote_type='upvote'):
 
 class PublicVotesAPITests(TestCase):
     """Test for API calls without authentication."""
+    client_class = APIClient
 
-    def setUp(self):
-        self.client = APIClient()
-        self.user = create_user(is_staff=True)
-        self.post = create_post(self.user)
-        self.comment = create_comment(self.user, self.post)
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(is_staff=True)
+        cls.post = create_post(cls.user)
+        cls.comment = create_comment(cls.user, cls.post)
 
     def test_no_auth_create_vote_not_allowed(self):
         """Test that voting is not allowed without authentication."""
@@ -66,13 +74,16 @@ class PublicVotesAPITests(TestCase):
 
 class PrivateVotesAPITests(TestCase):
     """Test for API calls that require authentication."""
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(is_staff=False)
+        cls.post = create_post(cls.user)
+        cls.comment = create_comment(cls.user, cls.post)
 
     def setUp(self):
-        self.client = APIClient()
-        self.user = create_user(is_staff=False)
         self.client.force_authenticate(self.user)
-        self.post = create_post(self.user)
-        self.comment = create_comment(self.user, self.post)
 
     def test_add_upvote(self):
         """Test that adding an upvote is successful."""
@@ -83,7 +94,7 @@ class PrivateVotesAPITests(TestCase):
         res = self.client.post(VOTES_URL, payload, format='json')
 
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        self.assertEqual(Vote.objects.all().count(), 1)
+        self.assertEqual(Vote.objects.count(), 1)
         self.assertEqual(res.data['vote_type'], payload['vote_type'])
         self.assertEqual(res.data['comment'], payload['comment'])
         self.assertEqual(res.data['user'], self.user.id)
@@ -97,7 +108,7 @@ class PrivateVotesAPITests(TestCase):
         res = self.client.post(VOTES_URL, payload, format='json')
 
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        self.assertEqual(Vote.objects.all().count(), 1)
+        self.assertEqual(Vote.objects.count(), 1)
         self.assertEqual(res.data['vote_type'], payload['vote_type'])
         self.assertEqual(res.data['comment'], payload['comment'])
         self.assertEqual(res.data['user'], self.user.id)
@@ -157,15 +168,65 @@ class PrivateVotesAPITests(TestCase):
 
     def test_double_downvote(self):
         """Test that voting down twice will result in 0 votes."""
+        # the first vote is created directly, test_double_upvote
+        # covers voting twice through the API
+        create_vote(self.user, self.comment, Vote.DOWNVOTE)
         payload = {
             'comment': self.comment.id,
             'vote_type': Vote.DOWNVOTE
         }
-        res_1 = self.client.post(VOTES_URL, payload, format='json')
-        res_2 = self.client.post(VOTES_URL, payload, format='json')
+        res = self.client.post(VOTES_URL, payload, format='json')
 
-        self.assertEqual(res_1.status_code, status.HTTP_201_CREATED)
-        self.assertEqual(res_2.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
         self.assertFalse(
             Vote.objects.filter(comment=self.comment, user=self.user).exists()
         )
+
+    def test_change_vote(self):
+        """Test that voting the opposite way updates the existing vote."""
+        vote = create_vote(self.user, self.comment, Vote.UPVOTE)
+        payload = {
+            'comment': self.comment.id,
+            'vote_type': Vote.DOWNVOTE
+        }
+        res = self.client.post(VOTES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['id'], vote.id)
+        self.assertEqual(res.data['vote_type'], Vote.DOWNVOTE)
+        vote.refresh_from_db()
+        self.assertEqual(vote.vote_type, Vote.DOWNVOTE)
+
+    def test_vote_serializer_user_from_request(self):
+        """Test that the user of the request votes when
+           no user is passed to save()."""
+        request = APIRequestFactory().post(VOTES_URL)
+        request.user = self.user
+        serializer = VoteSerializer(
+            data={'comment': self.comment.id, 'vote_type': Vote.UPVOTE},
+            context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        vote = serializer.save()
+
+        self.assertEqual(vote.user, self.user)
+
+    def test_vote_comment_deleted_before_insert(self):
+        """Test that voting for a comment deleted after the data
+           was validated returns an error for the comment."""
+        comment = create_comment(self.user, self.post)
+        serializer = VoteSerializer(data={
+            'comment': comment.id,
+            'vote_type': Vote.UPVOTE
+        })
+        serializer.is_valid(raise_exception=True)
+        comment.delete()
+
+        # SQLite checks foreign keys only on commit, so the failing
+        # insert is mocked
+        foreign_key_error = IntegrityError('FOREIGN KEY constraint failed')
+        with patch.object(Vote.objects, 'create', side_effect=foreign_key_error), \
+                self.assertRaises(ValidationError) as context:
+            serializer.save(user=self.user)
+
+        self.assertIn('comment', context.exception.detail)
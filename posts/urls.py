@@ -7,6 +7,9 @@ from rest_framework.routers import DefaultRouter
 from posts import views
 
 router = DefaultRouter()
+# The API is only served as JSON, so skip the format suffix
+# patterns, which would double the patterns matched per request
+router.include_format_suffixes = False
 router.register('posts', views.PostsViewSet)
 router.register('tags', views.TagViewSet)
 router.register('comments', views.CommentViewSer)
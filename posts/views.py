@@ -12,6 +12,9 @@ from rest_framework.permissions import (IsAdminUser,
                                         BasePermission,
                                         SAFE_METHODS)
 from rest_framework.response import Response
+from django.core.exceptions import ValidationError
+from django.db.models import Prefetch
+from django.db.models.functions import Lower
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
 from django.views.decorators.vary import vary_on_cookie
@@ -19,10 +22,31 @@ from django.views.decorators.vary import vary_on_cookie
 from core.models import Post, Tag, Comment, PostImage, Vote
 from posts import serializers
 
+# Post details include only this many of the newest comments
+MAX_POST_COMMENTS = 100
+
+# Orderings of the posts for each value of the sort parameter
+POST_SORT_ORDERINGS = {
+    'title-asc': Lower('title').asc(),
+    'title-desc': Lower('title').desc(),
+    'comments-asc': 'number_of_comments',
+    'comments-desc': '-number_of_comments',
+    'date-asc': 'created_at',
+    'date-desc': '-created_at',
+    'update-asc': 'updated_at',
+    'update-desc': '-updated_at',
+}
+
+
+class ReadOnlyOrAdmin(BasePermission):
+    """Allow read-only requests to everyone and other requests
+       only to staff. Safe methods are checked first, so the user
+       is not looked at for reads."""
 
-class ReadOnly(BasePermission):
     def has_permission(self, request, view):
-        return request.method in SAFE_METHODS
+        if request.method in SAFE_METHODS:
+            return True
+        return bool(request.user and request.user.is_staff)
 
 
 @extend_schema_view(
@@ -50,7 +74,7 @@ class PostsViewSet(viewsets.ModelViewSet):
        The cache is set to 60 minutes."""
     queryset = Post.objects.all()
     authentication_classes = [TokenAuthentication]
-    permission_classes = [IsAdminUser | ReadOnly]
+    permission_classes = [ReadOnlyOrAdmin]
 
     @method_decorator(vary_on_cookie)
     @method_decorator(cache_page(60 * 60))
@@ -59,36 +83,67 @@ class PostsViewSet(viewsets.ModelViewSet):
 
     @staticmethod
     def _params_to_ints(qs):
-        """Convert a list of string IDs to a list of integers."""
-        return [int(str_id) for str_id in qs.split(',')]
+        """Convert a comma-separated string of IDs to a set of integers.
+           Values that are not IDs are skipped."""
+        return {int(str_id) for str_id in qs.split(',') if str_id.isdigit()}
 
     def get_queryset(self):
         """Return post objects with optional filtering by tags and/ or sorting."""
-        queryset = self.queryset
+        # Fetch authors in the same query and tags in one extra query,
+        # password hashes of the authors are never serialized
+        queryset = self.queryset.select_related('author').prefetch_related(
+            'tags'
+        ).defer('author__password')
+        if self.action == 'list':
+            # Post bodies are included only in post details
+            queryset = queryset.defer('body')
+        else:
+            # Post details include the newest comments and all images,
+            # comments come with their authors' profiles. Prefetch
+            # querysets cannot be sliced, so the newest comments
+            # are selected in a subquery
+            try:
+                post_id = Post._meta.pk.to_python(self.kwargs.get('pk'))
+            except ValidationError:
+                # Not a post ID, get_object() returns 404 for it
+                post_id = None
+            newest_comments = Comment.objects.filter(
+                post_id=post_id
+            ).values('id')[:MAX_POST_COMMENTS]
+            comments = Comment.objects.filter(
+                id__in=newest_comments
+            ).select_related(
+                'author__user_profile'
+            ).defer('author__password')
+            if self.request.user.is_authenticated:
+                # Fetch the user's votes for all comments at once
+                comments = comments.prefetch_related(Prefetch(
+                    'vote_set',
+                    queryset=Vote.objects.filter(user=self.request.user),
+                    to_attr='user_votes'
+                ))
+            queryset = queryset.prefetch_related(
+                Prefetch('comment_set', queryset=comments),
+                'postimage_set'
+            )
+
         tags = self.request.query_params.get('tags')
-        if tags:
-            tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids).distinct()
+        tag_ids = self._params_to_ints(tags) if tags else None
+        if tag_ids:
+            # Match the tags in a subquery instead of joining them,
+            # so posts with several of the tags need no DISTINCT
+            queryset = queryset.filter(id__in=Post.tags.through.objects.filter(
+                tag_id__in=tag_ids
+            ).values('post_id'))
 
         sort = self.request.query_params.get('sort')
-        if sort:
-            queryset = list(queryset)
-            if sort == 'title-asc':
-                queryset.sort(key=lambda p: p.title.lower())
-            elif sort == 'title-desc':
-                queryset.sort(key=lambda p: p.title.lower(), reverse=True)
-            elif sort == 'comments-asc':
-                queryset.sort(key=lambda p: p.number_of_comments)
-            elif sort == 'comments-desc':
-                queryset.sort(key=lambda p: p.number_of_comments, reverse=True)
-            elif sort == 'date-asc':
-                queryset.sort(key=lambda p: p.created_at)
-            elif sort == 'date-desc':
-                queryset.sort(key=lambda p: p.created_at, reverse=True)
-            elif sort == 'update-asc':
-                queryset.sort(key=lambda p: p.updated_at)
-            elif sort == 'update-desc':
-                queryset.sort(key=lambda p: p.updated_at, reverse=True)
+        if sort in POST_SORT_ORDERINGS:
+            # Sort in the database, so that only one page of posts
+            # is fetched, ties keep the default ordering
+            queryset = queryset.order_by(
+                POST_SORT_ORDERINGS[sort],
+                *Post._meta.ordering
+            )
 
         return queryset
 
@@ -109,7 +164,7 @@ class TagViewSet(mixins.UpdateModelMixin,
                  viewsets.GenericViewSet):
     """Manage tags in the database"""
     authentication_classes = [TokenAuthentication]
-    permission_classes = [IsAdminUser | ReadOnly]
+    permission_classes = [ReadOnlyOrAdmin]
     serializer_class = serializers.TagSerializer
     queryset = Tag.objects.all()
 
@@ -119,6 +174,18 @@ class TagViewSet(mixins.UpdateModelMixin,
         else:
             return self.paginator.paginate_queryset(queryset, self.request, view=self)
 
+    def list(self, request, *args, **kwargs):
+        """List tags from the values of their columns. Tags are flat,
+           so building model instances and serializing them is skipped."""
+        queryset = self.filter_queryset(self.get_queryset()).values(
+            *self.get_serializer_class().Meta.fields
+        )
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(list(page))
+        return Response(list(queryset))
+
 
 class CommentViewSer(mixins.CreateModelMixin,
                      mixins.UpdateModelMixin,
@@ -133,20 +200,26 @@ class CommentViewSer(mixins.CreateModelMixin,
     def partial_update(self, request, *args, **kwargs):
         comment = self.get_object()
 
-        # Check if the user is the author of the comment
-        if comment.author != request.user:
+        # Check if the user is the author of the comment,
+        # comparing IDs does not need to fetch the author
+        if comment.author_id != request.user.id:
             return Response({'detail': 'You are not the author of this comment.'}, status=status.HTTP_403_FORBIDDEN)
 
-        return super().partial_update(request, *args, **kwargs)
+        # Update the fetched comment instead of fetching it again
+        serializer = self.get_serializer(comment, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return Response(serializer.data)
 
     def destroy(self, request, *args, **kwargs):
         comment = self.get_object()
 
         # Check if the user is the author of the comment
-        if comment.author != request.user:
+        if comment.author_id != request.user.id:
             return Response({'detail': 'You are not the author of this comment.'}, status=status.HTTP_403_FORBIDDEN)
 
-        return super().destroy(request, *args, **kwargs)
+        self.perform_destroy(comment)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     def perform_create(self, serializer):
         """Create a new comment."""
@@ -178,11 +251,12 @@ class VoteViewSet(mixins.CreateModelMixin,
     def destroy(self, request, *args, **kwargs):
         vote = self.get_object()
 
-        # Check if the user is the author of the comment
-        if vote.user != request.user:
+        # Check if the user is the author of the vote
+        if vote.user_id != request.user.id:
             return Response({'detail': 'You are not the author of this vote.'}, status=status.HTTP_403_FORBIDDEN)
 
-        return super().destroy(request, *args, **kwargs)
+        self.perform_destroy(vote)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     def perform_create(self, serializer):
         """Create a new vote."""
@@ -3,6 +3,7 @@ Serializers for the user API.
 """
 from django.contrib.auth import get_user_model, authenticate
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.db import transaction
 from django.utils.http import urlsafe_base64_decode
 from django.utils.translation import gettext as _
 
@@ -49,21 +50,24 @@ class UserProfileSerializer(serializers.ModelSerializer):
         """Create a new user with encrypted password and UserProfile."""
         user_data = validated_data.pop('user')
 
-        # Create the user object
-        user = get_user_model().objects.create_user(
-            email=user_data['email'],
-            username=user_data['username'],
-            password=user_data['password']
-        )
-
-        # Create the user profile object
-        profile = UserProfile.objects.create(
-            user=user,
-            first_name=validated_data.get('first_name', ''),
-            last_name=validated_data.get('last_name', ''),
-            date_of_birth=validated_data.get('date_of_birth', None),
-            profile_image=validated_data.get('profile_image', None),
-        )
+        # Both rows are committed together, so a failed profile
+        # insert does not leave a user without a profile
+        with transaction.atomic():
+            # Create the user object
+            user = get_user_model().objects.create_user(
+                email=user_data['email'],
+                username=user_data['username'],
+                password=user_data['password']
+            )
+
+            # Create the user profile object
+            profile = UserProfile.objects.create(
+                user=user,
+                first_name=validated_data.get('first_name', ''),
+                last_name=validated_data.get('last_name', ''),
+                date_of_birth=validated_data.get('date_of_birth', None),
+                profile_image=validated_data.get('profile_image', None),
+            )
         return profile
 
     def update(self, instance, validated_data):
@@ -79,13 +83,17 @@ class UserProfileSerializer(serializers.ModelSerializer):
             password = user_data.get('password', None)
             if password is not None:
                 user.set_password(password)
-            user.save()
-
-        instance.first_name = validated_data.get('first_name', instance.first_name)
-        instance.last_name = validated_data.get('last_name', instance.last_name)
-        instance.date_of_birth = validated_data.get('date_of_birth', instance.date_of_birth)
-        instance.profile_image = validated_data.get('profile_image', instance.profile_image)
-        instance.save()
+                user.save(update_fields=['password'])
+
+        # Write only the profile fields sent in the request,
+        # an empty list of fields skips the save
+        update_fields = [
+            field for field in self.Meta.fields
+            if field != 'user' and field in validated_data
+        ]
+        for field in update_fields:
+            setattr(instance, field, validated_data[field])
+        instance.save(update_fields=update_fields)
 
         return instance
 
@@ -4,19 +4,21 @@ Tests for the user API.
 import datetime
 
 from django.conf import settings
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
 from rest_framework import status
 
 from core.models import UserProfile
+from user.views import ManageUserView
 
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
 PROFILE_URL = reverse('user:profile')
 FORGOT_PASSWORD_URL = reverse('user:forgot-password')
+MANAGE_USER_VIEW = ManageUserView.as_view()
 
 SAMPLE_USER_DETAILS = {
     'email': 'test@example.com',
@@ -33,9 +35,18 @@ def create_user(**params):
 class PublicUserApiTests(TestCase):
     """Test the public (that do not require authentication)
        features of the user API."""
+    client_class = APIClient
 
-    def setUp(self):
-        self.client = APIClient()
+    @classmethod
+    def setUpTestData(cls):
+        # One existing user serves the tests that need one,
+        # so the password is hashed once per class
+        cls.user_details = {
+            'email': 'g@g.com',
+            'username': 'user12',
+            'password': '123123'
+        }
+        cls.user = create_user(**cls.user_details)
 
     def test_create_user_success(self):
         """Test creating a user is successful."""
@@ -50,15 +61,17 @@ class PublicUserApiTests(TestCase):
 
     def test_user_with_email_exists_error(self):
         """Test error returned if user with email exists."""
-        details = {
-            'email': 'g@g.com',
-            'username': 'user12',
-            'password': '123123'
+        # Only the email is the same as the existing user's
+        payload = {
+            'user': {
+                **self.user_details,
+                'username': 'someone_else'
+            }
         }
-        user = create_user(**details)
-        res = self.client.post(CREATE_USER_URL, {'user': {**details}}, format='json')
+        res = self.client.post(CREATE_USER_URL, payload, format='json')
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', res.data['user'])
 
     def test_password_too_short_error(self):
         """Test an error is returned if password less than 5 chars."""
@@ -79,16 +92,9 @@ class PublicUserApiTests(TestCase):
 
     def test_create_token_for_user(self):
         """Test generates token for valid credentials."""
-        details = {
-            'email': 'x@x.com',
-            'username': 'aaa2',
-            'password': '123123'
-        }
-        create_user(**details)
-
         payload = {
-            'email': details['email'],
-            'password': details['password']
+            'email': self.user_details['email'],
+            'password': self.user_details['password']
         }
         res = self.client.post(TOKEN_URL, payload, format='json')
 
@@ -97,11 +103,8 @@ class PublicUserApiTests(TestCase):
 
     def test_create_token_bad_credentials(self):
         """Test returns error if credentials are invalid."""
-
-        user = create_user(email='e@e.com', username='user23', password='password')
-
-        payload = {'email': user.email, 'password': 'wrongPassword'}
-        res = self.client.post(TOKEN_URL, payload)
+        payload = {'email': self.user.email, 'password': 'wrongPassword'}
+        res = self.client.post(TOKEN_URL, payload, format='json')
 
         self.assertNotIn('token', res.data)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -109,47 +112,69 @@ class PublicUserApiTests(TestCase):
     def test_create_token_email_not_found(self):
         """Test returns error if the user with given email cannot be found."""
         payload = {'email': 'email@example.com', 'password': 'pass123'}
-        res = self.client.post(TOKEN_URL, payload)
+        res = self.client.post(TOKEN_URL, payload, format='json')
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertNotIn('token', res.data)
 
+    def test_forgot_password_email_not_found(self):
+        """Test error is returned if the user asking for password reset
+           with the given email does not exist."""
+        res = self.client.post(FORGOT_PASSWORD_URL, {'email': 'wrong@email.com'}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn('link', res.data)
+
+
+class PublicUserApiNoDatabaseTests(SimpleTestCase):
+    """Test public user API requests that are rejected
+       before the database is used."""
+    client_class = APIClient
+    factory = APIRequestFactory()
+
     def test_create_token_blank_password(self):
         """Test posting a blank password returns an error."""
         payload = {'email': 'test6@example.com', 'password': ''}
-        res = self.client.post(TOKEN_URL, payload)
+        res = self.client.post(TOKEN_URL, payload, format='json')
 
         self.assertNotIn('token', res.data)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
     def test_retrieve_user_unauthorized(self):
         """Test authentication is required to get to the users profile."""
-        res = self.client.get(PROFILE_URL)
+        # Only the permission check is tested, so the view
+        # is called directly, without the middleware
+        res = MANAGE_USER_VIEW(self.factory.get(PROFILE_URL))
 
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
-    def test_forgot_password_email_not_found(self):
-        """Test error is returned if the user asking for password reset
-           with the given email does not exist."""
-        res = self.client.post(FORGOT_PASSWORD_URL, {'email': 'wrong@email.com'}, format='json')
+    def test_post_profile_not_allowed(self):
+        """Test POST is not allowed for the 'profile' endpoint."""
+        # The method is rejected before the user is used,
+        # so an unsaved user is enough to authenticate
+        request = self.factory.post(PROFILE_URL, {}, format='json')
+        force_authenticate(request, user=get_user_model()(email='user@example.com'))
+        res = MANAGE_USER_VIEW(request)
 
-        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
-        self.assertNotIn('link', res.data)
+        self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
 class PrivateUserApiTests(TestCase):
     """Test API requests that require authentication."""
+    client_class = APIClient
 
-    def setUp(self):
-        self.user = create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(
             email='user@example.com',
             username='username',
             password='password123'
         )
         UserProfile.objects.create(
-            user=self.user
+            user=cls.user
         )
-        self.client = APIClient()
+
+    def setUp(self):
         self.client.force_authenticate(user=self.user)
 
     def test_retrieve_profile_success(self):
@@ -158,19 +183,12 @@ class PrivateUserApiTests(TestCase):
         user = res.data['user']
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertIn('user', res.data)
+        self.assertLessEqual(
+            {'user', 'first_name', 'last_name', 'date_of_birth', 'profile_image'},
+            res.data.keys()
+        )
         self.assertEqual(user['email'], self.user.email)
         self.assertEqual(user['username'], self.user.username)
-        self.assertIn('first_name', res.data)
-        self.assertIn('last_name', res.data)
-        self.assertIn('date_of_birth', res.data)
-        self.assertIn('profile_image', res.data)
-
-    def test_post_profile_not_allowed(self):
-        """Test POST is not allowed for the 'profile' endpoint."""
-        res = self.client.post(PROFILE_URL, {})
-
-        self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
 
     def test_update_password(self):
         """Test updating the user password."""
@@ -201,7 +219,7 @@ class PrivateUserApiTests(TestCase):
         payload = {
             'first_name': 'John',
             'last_name': 'Something',
-            'date_of_birth': date_of_birth.strftime('%Y-%m-%d')
+            'date_of_birth': date_of_birth.isoformat()
         }
         res = self.client.patch(PROFILE_URL, payload, format='json')
         profile = UserProfile.objects.filter(user=self.user).first()